@@ -7,7 +7,8 @@ install_requires = [
     'requests>=2.9.1',
     'responses>=0.5.0',
     'pydub>=0.16.0',
-    'apscheduler>=3.0.5'
+    'apscheduler>=3.0.5',
+    'futures>=3.0.5; python_version < "3"'
 ]
 
 setup(
@@ -25,5 +26,8 @@ setup(
         "Development Status :: 4 - Beta",
         "Topic :: Software Development :: Libraries :: Python Modules"
     ],
-    install_requires=install_requires
+    install_requires=install_requires,
+    entry_points={
+        'console_scripts': ['typecaster = typecaster.cli:main']
+    }
 )
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+import mmap
+import unittest
+from pydub import AudioSegment
+
+from typecaster.buffers import MemoryBudget, PCMBuffer
+
+
+class TestBuffers(unittest.TestCase):
+    def setUp(self):
+        self.sample = AudioSegment.from_wav('tests/test_files/test.wav')
+        self.size = len(self.sample.raw_data)
+
+    def test_memory_budget(self):
+        budget = MemoryBudget(limit=10)
+
+        self.assertTrue(budget.reserve(6))
+        self.assertFalse(budget.reserve(6))
+        budget.release(6)
+        self.assertTrue(budget.reserve(6))
+
+    def test_buffer_in_memory(self):
+        budget = MemoryBudget()
+
+        with PCMBuffer(budget) as buffer:
+            buffer.append(self.sample)
+            buffer.append(self.sample)
+            segment = buffer.to_segment()
+
+            self.assertFalse(buffer.spilled)
+            self.assertEquals(budget.used, self.size * 2)
+            self.assertEquals(segment.raw_data, self.sample.raw_data * 2)
+
+        self.assertEquals(budget.used, 0)
+
+    def test_buffer_spill(self):
+        budget = MemoryBudget(limit=int(self.size * 1.5))
+
+        with PCMBuffer(budget) as buffer:
+            buffer.append(self.sample)
+            buffer.append(self.sample)
+            segment = buffer.to_segment()
+
+            self.assertTrue(buffer.spilled)
+            self.assertEquals(budget.used, 0)
+            self.assertIsInstance(segment.raw_data, mmap.mmap)
+            self.assertEquals(segment.raw_data[:], self.sample.raw_data * 2)
+
+    def test_buffer_spill_join(self):
+        # Both chunks fit in the budget, but joining them would not.
+        budget = MemoryBudget(limit=self.size * 3)
+
+        with PCMBuffer(budget) as buffer:
+            buffer.append(self.sample)
+            buffer.append(self.sample)
+            self.assertFalse(buffer.spilled)
+            segment = buffer.to_segment()
+
+            self.assertTrue(buffer.spilled)
+            self.assertEquals(budget.used, 0)
+            self.assertEquals(segment.raw_data[:], self.sample.raw_data * 2)
+
+    def test_buffer_empty(self):
+        with PCMBuffer(MemoryBudget()) as buffer:
+            self.assertEquals(len(buffer.to_segment()), 0)
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import unittest
+import responses
+import xml.etree.ElementTree as ET
+
+from typecaster import cli
+
+
+def catch_requests():
+    # Catch synthesize requests and insert test .wav file as response
+    with open("tests/test_files/test.wav", "rb") as test:
+        test_response = test.read()
+
+    responses.add(responses.GET, 'https://stream.watsonplatform.net/text-to-speech/api/v1/synthesize',
+                  body=test_response, status=200)
+
+
+class TestCLI(unittest.TestCase):
+    def setUp(self):
+        self.source_dir = '.test_cli_source'
+        self.output_path = '.test_cli'
+        os.makedirs(self.source_dir)
+
+        with open(self.source_dir + '/episode_1.txt', 'w') as source:
+            source.write('hello')
+        with open(self.source_dir + '/notes.md', 'w') as source:
+            source.write('ignored')
+
+        self.synth_args = self.output_path + '_synth_args.json'
+        with open(self.synth_args, 'w') as synth_args:
+            synth_args.write('{"username": "", "password": ""}')
+
+    def test_scan(self):
+        changed, removed, touched = cli.scan(self.source_dir, {})
+
+        self.assertEquals([document[0] for document in changed], ['episode_1.txt'])
+        self.assertEquals(removed, [])
+        self.assertEquals(touched, [])
+
+    def test_scan_unchanged(self):
+        path = self.source_dir + '/episode_1.txt'
+        stat = os.stat(path)
+        index = {'episode_1.txt': {'mtime': stat.st_mtime, 'size': stat.st_size, 'sha1': 'not checked'}}
+
+        changed, removed, touched = cli.scan(self.source_dir, index)
+
+        self.assertEquals(changed, [])
+        self.assertEquals(touched, [])
+
+    def test_scan_touched(self):
+        path = self.source_dir + '/episode_1.txt'
+        stat = os.stat(path)
+        index = {'episode_1.txt': {'mtime': 0, 'size': stat.st_size, 'sha1': cli.file_hash(path)},
+                 'deleted.txt': {'mtime': 0, 'size': 0, 'sha1': ''}}
+
+        changed, removed, touched = cli.scan(self.source_dir, index)
+
+        self.assertEquals(changed, [])
+        self.assertEquals(removed, ['deleted.txt'])
+        self.assertEquals(touched, ['episode_1.txt'])
+        self.assertEquals(index['episode_1.txt']['mtime'], stat.st_mtime)
+
+    def test_episode_title(self):
+        taken = set()
+        titles = []
+        for relative_path in ['a.html', 'a.txt', os.path.join('x', 'y.txt'), 'x y.txt']:
+            titles.append(cli.episode_title(relative_path, taken))
+            taken.add(cli.episode_name(titles[-1]))
+
+        self.assertEquals(titles, ['a', 'a (2)', 'x y', 'x y (2)'])
+
+    @responses.activate
+    def test_main_title_collision(self):
+        catch_requests()
+        with open(self.source_dir + '/episode_1.html', 'w') as source:
+            source.write('<p>hello</p>')
+
+        args = [self.source_dir, self.output_path, '--title', 'Test Podcast', '--link', 'http://test.com',
+                '--author', 'Test Author', '--synth-args', self.synth_args]
+        cli.main(args)
+
+        self.assertEquals(len(responses.calls), 2)
+        self.assertTrue(os.path.isfile(self.output_path + '/episode_1.mp3'))
+        self.assertTrue(os.path.isfile(self.output_path + '/episode_1_(2).mp3'))
+
+    @responses.activate
+    def test_main(self):
+        catch_requests()
+
+        args = [self.source_dir, self.output_path, '--title', 'Test Podcast', '--link', 'http://test.com',
+                '--author', 'Test Author', '--synth-args', self.synth_args]
+        cli.main(args)
+        cli.main(args)
+
+        self.assertEquals(len(responses.calls), 1)
+        self.assertTrue(os.path.isfile(self.output_path + '/episode_1.mp3'))
+
+        items = ET.parse(self.output_path + '/feed.xml').getroot().find('channel').findall('item')
+        self.assertEquals([item.find('title').text for item in items], ['episode_1'])
+
+    @responses.activate
+    def test_main_failed_render(self):
+        with open("tests/test_files/test.wav", "rb") as test:
+            test_response = test.read()
+
+        def synthesize(request):
+            if 'broken' in request.url:
+                return (200, {}, b'not audio')
+            return (200, {}, test_response)
+
+        responses.add_callback(responses.GET, 'https://stream.watsonplatform.net/text-to-speech/api/v1/synthesize',
+                               callback=synthesize)
+
+        args = [self.source_dir, self.output_path, '--title', 'Test Podcast', '--link', 'http://test.com',
+                '--author', 'Test Author', '--synth-args', self.synth_args]
+        cli.main(args)
+
+        with open(self.source_dir + '/episode_1.txt', 'w') as source:
+            source.write('broken text')
+        with open(self.source_dir + '/episode_2.txt', 'w') as source:
+            source.write('hello')
+        cli.main(args)
+
+        items = ET.parse(self.output_path + '/feed.xml').getroot().find('channel').findall('item')
+        self.assertEquals(sorted(item.find('title').text for item in items), ['episode_1', 'episode_2'])
+
+    def tearDown(self):
+        for path in [self.source_dir, self.output_path]:
+            if os.path.exists(path):
+                shutil.rmtree(path)
+        os.remove(self.synth_args)
@@ -2,13 +2,15 @@
 import os
 import shutil
 import responses
-from datetime import datetime
+import threading
+from datetime import datetime, timedelta
 import unittest
 from time import sleep
 from pydub import AudioSegment
 import xml.etree.ElementTree as ET
 
-from typecaster.models import Podcast
+from typecaster.models import Podcast, NOT_MODIFIED
+from typecaster.scheduling import JobService
 
 
 def catch_requests():
@@ -30,6 +32,16 @@ class TestModels(unittest.TestCase):
         self.podcast = Podcast(title='Test Podcast', link='http://test.com', author='Test Author',
                                description='This is a test podcast', output_path=self.output_path)
 
+    def test_podcast_deferred_feed(self):
+        shutil.rmtree(self.output_path)
+        job_service = JobService()
+        Podcast(title='Test Podcast', link='http://test.com', author='Test Author',
+                description='This is a test podcast', output_path=self.output_path, update_feed=False,
+                job_service=job_service)
+
+        self.assertFalse(os.path.exists(self.output_path))
+        self.assertIsNone(job_service._scheduler)
+
     @responses.activate
     def test_podcast_add_episode(self):
         catch_requests()
@@ -50,6 +62,10 @@ class TestModels(unittest.TestCase):
         with self.assertRaises(ValueError):
             self.podcast.add_episode('goodbye', 'html', episode_title, 'Test Episode Author 2', synth_args=self.synth_args)
 
+    def test_podcast_add_fragment_value_error(self):
+        with self.assertRaises(ValueError):
+            self.podcast.add_fragment('my-intro', audio_path='tests/test_files/test.wav')
+
     @responses.activate
     def test_podcast_publish(self):
         catch_requests()
@@ -167,6 +183,81 @@ class TestModels(unittest.TestCase):
 
         self.podcast._scheduler.shutdown()
 
+    @responses.activate
+    def test_podcast_add_scheduled_job_dedupe_skip(self):
+        catch_requests()
+
+        title = 'scheduled'
+        self.podcast.add_scheduled_job(lambda: 'hello', {'year': '2100'}, 'plain', title, 'me', synth_args=self.synth_args,
+                                       dedupe='skip')
+        job = self.podcast.scheduled_jobs[title]
+        job.func()
+        job.func()
+
+        self.assertEquals(len(self.podcast.episodes), 1)
+        self.assertEquals(len(responses.calls), 1)
+
+    @responses.activate
+    def test_podcast_add_scheduled_job_dedupe_republish(self):
+        catch_requests()
+
+        title = 'scheduled'
+        self.podcast.add_scheduled_job(lambda: 'hello', {'year': '2100'}, 'plain', title, 'me', synth_args=self.synth_args,
+                                       dedupe='republish')
+        job = self.podcast.scheduled_jobs[title]
+        job.func()
+        episode = list(self.podcast.episodes.values())[0]
+        first_publish_date = episode.publish_date
+        sleep(0.01)
+        job.func()
+
+        self.assertEquals(len(self.podcast.episodes), 1)
+        self.assertGreater(episode.publish_date, first_publish_date)
+
+    @responses.activate
+    def test_podcast_add_scheduled_job_lead_time(self):
+        catch_requests()
+
+        title = 'scheduled'
+        self.podcast.add_scheduled_job(lambda: 'hello', {'year': '2100', 'month': '6'}, 'plain', title, 'me', synth_args=self.synth_args,
+                                       lead_time=300)
+        publish_job = self.podcast.scheduled_jobs[title]
+        prepare_job = self.podcast._scheduler.scheduler.get_job(self.output_path + '/' + title + '/prepare')
+        self.assertEquals(publish_job.next_run_time - prepare_job.next_run_time, timedelta(seconds=300))
+
+        prepare_job.func()
+        self.assertEquals(len(self.podcast.episodes), 1)
+        episode = list(self.podcast.episodes.values())[0]
+        self.assertEquals(episode.publish_date.year, 2100)
+        self.assertFalse(episode.published)
+
+        publish_job.func()
+        self.assertEquals(len(responses.calls), 1)
+        self.assertTrue(episode.published)
+
+    @responses.activate
+    def test_podcast_add_scheduled_job_lead_time_fallback(self):
+        catch_requests()
+
+        title = 'scheduled'
+        self.podcast.add_scheduled_job(lambda: 'hello', {'year': '2100'}, 'plain', title, 'me', synth_args=self.synth_args,
+                                       lead_time=300)
+        self.podcast.scheduled_jobs[title].func()
+
+        self.assertEquals(len(self.podcast.episodes), 1)
+        self.assertTrue(list(self.podcast.episodes.values())[0].published)
+
+    def test_podcast_add_scheduled_job_not_modified(self):
+        title = 'scheduled'
+        self.podcast.add_scheduled_job(lambda: NOT_MODIFIED, {'year': '2100'}, 'plain', title, 'me')
+        self.podcast.scheduled_jobs[title].func()
+
+        self.assertEquals(len(self.podcast.episodes), 0)
+
+    def test_podcast_add_scheduled_job_dedupe_value_error(self):
+        with self.assertRaises(ValueError):
+            self.podcast.add_scheduled_job(lambda: 'hello', {'year': '2100'}, 'plain', 'title', 'me', dedupe='not found')
+
     def test_podcast_add_scheduled_job_type_error(self):
         with self.assertRaises(TypeError):
             self.podcast.add_scheduled_job('error', {'hour': '1'}, 'plain', 'title', 'me')
@@ -179,6 +270,145 @@ class TestModels(unittest.TestCase):
         self.podcast.add_episode('hello', 'plain', episode_title, 'Test Episode Author', sentence_break=' ', synth_args=self.synth_args)
         self.assertEquals(self.podcast.episodes[episode_title].text, 'hello')
 
+    @responses.activate
+    def test_episode_text_on_disk(self):
+        catch_requests()
+
+        episode_title = 'Test Episode 1'
+        self.podcast.add_episode('hello', 'plain', episode_title, 'Test Episode Author', synth_args=self.synth_args)
+        episode = self.podcast.episodes[episode_title]
+
+        self.assertFalse(hasattr(episode, '__dict__'))
+        with open(self.output_path + '/test_episode_1.ssml') as text_file:
+            self.assertEquals(text_file.read(), 'hello')
+
+    @responses.activate
+    def test_podcast_add_episode_iterable(self):
+        catch_requests()
+
+        episode_title = 'Test Episode 1'
+        self.podcast.add_episode(iter(['<p>hello. </p>', '<p>goodbye</p>']), 'html', episode_title, 'Test Episode Author',
+                                 synth_args=self.synth_args)
+
+        self.assertEquals(len(responses.calls), 2)
+        self.assertEquals(self.podcast.episodes[episode_title].text,
+                          '<break time="0.5s" /><paragraph>hello. </paragraph><break time="0.5s" /><paragraph>goodbye</paragraph>')
+
+    @responses.activate
+    def test_podcast_add_episode_iterable_error(self):
+        catch_requests()
+
+        def pieces():
+            yield 'hello. '
+            raise IOError('Download failed.')
+
+        with self.assertRaises(IOError):
+            self.podcast.add_episode(pieces(), 'plain', 'Test Episode 1', 'Test Episode Author', synth_args=self.synth_args)
+
+        self.assertEquals(os.listdir(self.output_path), ['feed.xml'])
+
+    @responses.activate
+    def test_episode_stream(self):
+        catch_requests()
+
+        episode_title = 'Test Episode 1'
+        self.podcast.add_episode('hello world. ' * 30, 'plain', episode_title, 'Test Episode Author', synth_args=self.synth_args,
+                                 render=False)
+        episode = self.podcast.episodes[episode_title]
+        self.assertEquals(len(responses.calls), 0)
+
+        chunks = list(episode.stream())
+
+        self.assertEquals(len(chunks), 30)
+        self.assertEquals(len(responses.calls), 30)
+        with open(episode.link, 'rb') as audio:
+            self.assertEquals(audio.read(), b''.join(chunks))
+        self.assertEquals(episode.length, len(b''.join(chunks)))
+
+    @responses.activate
+    def test_episode_stream_interrupted(self):
+        catch_requests()
+        downloading = threading.Event()
+
+        def pieces():
+            yield 'one. '
+            yield 'two. '
+            downloading.wait()
+            for piece in ['three. ', 'four. ', 'five. ']:
+                yield piece
+
+        episode_title = 'Test Episode 1'
+        self.podcast.add_episode(pieces(), 'plain', episode_title, 'Test Episode Author', synth_args=self.synth_args,
+                                 render=False)
+        episode = self.podcast.episodes[episode_title]
+
+        stream = episode.stream()
+        next(stream)
+        stream.close()
+        downloading.set()
+
+        self.assertFalse(os.path.exists(episode.link + '.part'))
+        self.assertFalse(os.path.exists(episode.link))
+
+        list(episode.stream())
+
+        self.assertEquals(episode.text, 'one. two. three. four. five. ')
+        self.assertEquals(len(responses.calls), 6)
+        self.assertTrue(episode.length > 0)
+
+    @responses.activate
+    def test_episode_text_before_stream(self):
+        catch_requests()
+
+        episode_title = 'Test Episode 1'
+        self.podcast.add_episode(iter(['hello. ', 'goodbye']), 'plain', episode_title, 'Test Episode Author',
+                                 synth_args=self.synth_args, render=False)
+        episode = self.podcast.episodes[episode_title]
+
+        self.assertEquals(episode.text, 'hello. goodbye')
+        with self.assertRaises(Warning):
+            self.podcast.publish(episode_title)
+
+        episode.render_audio()
+        self.podcast.publish(episode_title)
+
+        self.assertEquals(len(responses.calls), 1)
+        self.assertTrue(episode.published)
+
+    @responses.activate
+    def test_episode_stream_rendered(self):
+        catch_requests()
+
+        episode_title = 'Test Episode 1'
+        self.podcast.add_episode('hello', 'plain', episode_title, 'Test Episode Author', synth_args=self.synth_args)
+        episode = self.podcast.episodes[episode_title]
+
+        data = b''.join(episode.stream())
+
+        self.assertEquals(len(responses.calls), 1)
+        with open(episode.link, 'rb') as audio:
+            self.assertEquals(audio.read(), data)
+
+    @responses.activate
+    def test_podcast_add_episode_compact(self):
+        catch_requests()
+
+        episode_title = 'Test Episode 1'
+        self.podcast.add_episode('<script>track();</script><b>hello</b>   world', 'html', episode_title, 'Test Episode Author',
+                                 synth_args=self.synth_args)
+
+        self.assertEquals(self.podcast.episodes[episode_title].text, '<emphasis>hello</emphasis> world')
+
+    @responses.activate
+    def test_podcast_add_episode_compact_sentence_break(self):
+        catch_requests()
+
+        episode_title = 'Test Episode 1'
+        self.podcast.add_episode('hello world\n' * 30, 'plain', episode_title, 'Test Episode Author', sentence_break='\n',
+                                 synth_args=self.synth_args)
+
+        self.assertEquals(len(responses.calls), 30)
+
     @responses.activate
     def test_episode_text_setter(self):
         catch_requests()
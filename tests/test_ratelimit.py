@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+import threading
+import unittest
+from time import sleep
+
+from typecaster import ratelimit
+
+
+class Response(object):
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class TestRateLimit(unittest.TestCase):
+    def test_token_bucket(self):
+        bucket = ratelimit.TokenBucket(rate=100)
+
+        self.assertEquals(bucket.delay(100), 0)
+        bucket.consume(100)
+        self.assertGreater(bucket.delay(50), 0.4)
+
+    def test_token_bucket_large_cost(self):
+        bucket = ratelimit.TokenBucket(rate=10)
+
+        self.assertEquals(bucket.delay(1000), 0)
+
+    def test_submit_additive_increase(self):
+        scheduler = ratelimit.SynthesisScheduler(concurrency=4)
+        scheduler.submit(lambda: Response(200))
+
+        self.assertEquals(scheduler.concurrency, 4.25)
+
+    def test_submit_throttled(self):
+        scheduler = ratelimit.SynthesisScheduler(concurrency=8)
+        responses = [Response(429, {'Retry-After': '0'}), Response(200)]
+
+        response = scheduler.submit(lambda: responses.pop(0))
+
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(scheduler.concurrency, 4.25)
+
+    def test_submit_throttled_error(self):
+        scheduler = ratelimit.SynthesisScheduler(max_retries=1)
+
+        with self.assertRaises(ratelimit.ThrottledError):
+            scheduler.submit(lambda: Response(429, {'Retry-After': '0'}))
+
+    def test_submit_priority(self):
+        scheduler = ratelimit.SynthesisScheduler(concurrency=1, max_concurrency=1)
+        order = []
+        blocker = threading.Event()
+
+        first = threading.Thread(target=scheduler.submit, args=(lambda: blocker.wait(),))
+        first.start()
+        sleep(0.1)
+
+        threads = []
+        for priority in ['batch', 'interactive']:
+            thread = threading.Thread(target=scheduler.submit, args=(lambda priority=priority: order.append(priority),),
+                                      kwargs={'priority': priority})
+            thread.start()
+            threads.append(thread)
+            sleep(0.1)
+
+        blocker.set()
+        for thread in [first] + threads:
+            thread.join()
+
+        self.assertEquals(order, ['interactive', 'batch'])
+
+    def test_submit_priority_not_found(self):
+        scheduler = ratelimit.SynthesisScheduler()
+
+        with self.assertRaises(ValueError):
+            scheduler.submit(lambda: Response(200), priority='not found')
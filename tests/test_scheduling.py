@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+import threading
+import unittest
+from datetime import datetime, timedelta
+from time import sleep
+from apscheduler.triggers.cron import CronTrigger
+
+from typecaster.scheduling import JobService, lead_trigger
+
+
+def job():
+    pass
+
+
+class TestScheduling(unittest.TestCase):
+    def setUp(self):
+        self.service = JobService(max_workers=2)
+
+    def test_lazy_scheduler(self):
+        self.assertIsNone(self.service._scheduler)
+        self.assertFalse(self.service.running)
+        self.assertEquals(self.service.get_jobs(), [])
+
+    def test_add_job(self):
+        self.service.add_job(job, 'cron', id='podcast_1/job', hour='1')
+        self.service.add_job(job, 'cron', id='podcast_2/job', hour='1')
+
+        self.assertTrue(self.service.running)
+        self.assertEquals(sorted(j.id for j in self.service.get_jobs()), ['podcast_1/job', 'podcast_2/job'])
+
+    def test_add_job_more_than_workers(self):
+        # Jobs that wait for a free worker longer than APScheduler's default
+        # misfire grace time must still run.
+        runs = []
+        done = threading.Semaphore(0)
+
+        def slow_job():
+            sleep(0.6)
+            runs.append(1)
+            done.release()
+
+        run_date = datetime.now() + timedelta(seconds=0.5)
+        for i in range(6):
+            self.service.add_job(slow_job, 'date', id='job_' + str(i), run_date=run_date)
+
+        for i in range(6):
+            self.assertTrue(done.acquire(timeout=10))
+        self.assertEquals(len(runs), 6)
+
+    def test_pause_resume(self):
+        self.service.add_job(job, 'cron', id='job', hour='1')
+        self.service.pause()
+        self.assertTrue(self.service.running)
+        self.service.resume()
+        self.assertTrue(self.service.running)
+
+    def test_shutdown(self):
+        self.service.add_job(job, 'cron', id='job', hour='1')
+        self.service.shutdown()
+
+        self.assertFalse(self.service.running)
+        self.assertEquals(self.service.get_jobs(), [])
+
+        self.service.add_job(job, 'cron', id='job', hour='1')
+        self.assertTrue(self.service.running)
+
+    def test_lead_trigger(self):
+        cron_trigger = CronTrigger(hour='7', timezone='UTC')
+        utc = cron_trigger.timezone
+        trigger = lead_trigger(cron_trigger, timedelta(minutes=5))
+
+        now = datetime(2016, 1, 1, 6, tzinfo=utc)
+        self.assertEquals(trigger.get_next_fire_time(None, now), datetime(2016, 1, 1, 6, 55, tzinfo=utc))
+
+        now = datetime(2016, 1, 1, 6, 56, tzinfo=utc)
+        self.assertEquals(trigger.get_next_fire_time(None, now), datetime(2016, 1, 2, 6, 55, tzinfo=utc))
+
+    def test_add_job_lead_time(self):
+        self.service.add_job(job, 'cron', id='job', hour='7')
+        self.service.add_job(job, 'cron', id='job/prepare', lead_time=timedelta(minutes=5), hour='7')
+
+        job_time = self.service.scheduler.get_job('job').next_run_time
+        prepare_time = self.service.scheduler.get_job('job/prepare').next_run_time
+        self.assertEquals(job_time - prepare_time, timedelta(minutes=5))
+
+    def tearDown(self):
+        self.service.shutdown()
@@ -11,6 +11,9 @@ class TestSSML(unittest.TestCase):
         self.html = '<h1>hello</h1>'
         self.plain_ssml = 'hello. goodbye!'
         self.html_ssml = '<prosody rate="slow" volume="95"><break time="1s" />hello</prosody>'
+        self.page = ('<html><head><style>p { color: red; }</style></head><body><nav><a href="/">Home</a></nav>\n\n'
+                     '<p>Caf&eacute; &amp;   <i>bar</i></p><p> </p><!-- ad --><script>track();</script></body></html>')
+        self.page_ssml = u'<break time="0.5s" /><paragraph>Caf\xe9 &amp; bar</paragraph><break time="0.5s" />'
 
     def test_from_none(self):
         none_ssml = ssml.convert_to_ssml(self.plain, text_format=None)
@@ -30,3 +33,64 @@ class TestSSML(unittest.TestCase):
     def test_from_not_found(self):
         with self.assertRaises(ValueError):
             not_found_ssml = ssml.convert_to_ssml(self.plain, 'not found')  # noqa
+
+    def test_compact(self):
+        html_ssml = ssml.convert_to_ssml(self.page, 'html')
+        compact_ssml, characters_saved = ssml.compact_ssml(html_ssml)
+
+        self.assertEquals(compact_ssml, self.page_ssml)
+        self.assertEquals(characters_saved, len(html_ssml) - len(self.page_ssml))
+
+    def test_compact_keeps_ssml(self):
+        compact_ssml, characters_saved = ssml.compact_ssml(self.html_ssml)
+
+        self.assertEquals(compact_ssml, self.html_ssml)
+        self.assertEquals(characters_saved, 0)
+
+    def test_compact_keeps_watson_ssml(self):
+        watson_ssml = '<voice-transformation type="Young">hello</voice-transformation>'
+        compact_ssml, characters_saved = ssml.compact_ssml(watson_ssml)
+
+        self.assertEquals(compact_ssml, watson_ssml)
+
+    def test_compact_keeps_header(self):
+        compact_ssml, characters_saved = ssml.compact_ssml('<header><h1>Headline</h1></header>')
+
+        self.assertEquals(compact_ssml.strip(), 'Headline')
+
+    def test_compact_without_strip_tags(self):
+        text = '<speak><custom-tag>hello</custom-tag></speak>'
+        compact_ssml, characters_saved = ssml.compact_ssml(text, strip_tags=False)
+
+        self.assertEquals(compact_ssml, text)
+
+    def test_compact_sentence_break(self):
+        compact_ssml, characters_saved = ssml.compact_ssml('hello  world\n\n<b>goodbye</b>\n', sentence_break='\n')
+
+        self.assertEquals(compact_ssml, 'hello world\ngoodbye')
+
+    def test_compact_pieces(self):
+        pieces = ['hello. <scr', 'ipt>track(). ', 'more();</script> wor', 'ld. good', 'bye']
+        compact_pieces = list(ssml.compact_pieces(pieces))
+
+        self.assertEquals(''.join(compact_pieces), 'hello. world. goodbye')
+        self.assertEquals(compact_pieces[0], 'hello. ')
+
+    def test_compact_pieces_characters_saved(self):
+        pieces = ['hello.  <b>wor', 'ld</b>. <!-- ad -->', 'goodbye ']
+        savings = []
+        compact_pieces = ''.join(ssml.compact_pieces(pieces, callback=savings.append))
+
+        self.assertEquals(compact_pieces, 'hello. world. goodbye')
+        self.assertEquals(savings, [len(''.join(pieces)) - len(compact_pieces)])
+
+    def test_compact_inline_tags(self):
+        compact_ssml, characters_saved = ssml.compact_ssml('<a href="/w">Wiki</a>pedia is <span>un</span>likely.<br>Next')
+
+        self.assertEquals(compact_ssml, 'Wikipedia is unlikely. Next')
+
+    def test_compact_html_tags(self):
+        compact_ssml, characters_saved = ssml.compact_ssml('H<sub>2</sub>O is <mark>key</mark>, <s>old</s> '
+                                                           '<sub alias="World Wide Web">WWW</sub><mark name="end"/>')
+
+        self.assertEquals(compact_ssml, 'H2O is key, old <sub alias="World Wide Web">WWW</sub><mark name="end"/>')
@@ -114,6 +114,54 @@ class TestUtils(unittest.TestCase):
         with self.assertRaises(Warning):
             audio = utils.text_to_speech(text='text', synthesizer=self.synthesizer, synth_args={'username': ''}, sentence_break=' ')  # noqa
 
+    @responses.activate
+    def test_text_to_speech_fragments(self):
+        catch_requests()
+
+        sample = AudioSegment.from_wav('tests/test_files/test.wav')
+        fragments = {'intro': sample, 'outro': sample}
+
+        audio = utils.text_to_speech(text='{{intro}} hello {{ outro }}', synthesizer=self.synthesizer, synth_args=self.synth_args,
+                                     sentence_break='. ', fragments=fragments)
+
+        self.assertEquals(len(responses.calls), 1)
+        self.assertEquals(audio.frame_count(), sample.frame_count() * 3)
+
+    @responses.activate
+    def test_text_to_speech_fragment_not_found(self):
+        catch_requests()
+
+        with self.assertRaises(ValueError):
+            audio = utils.text_to_speech(text='{{missing}} hello', synthesizer=self.synthesizer, synth_args=self.synth_args,  # noqa
+                                         sentence_break='. ', fragments={'intro': AudioSegment.empty()})
+
+    @responses.activate
+    def test_text_to_speech_iterable(self):
+        catch_requests()
+
+        def pieces():
+            yield 'hello. good'
+            yield 'bye. hello'
+
+        audio = utils.text_to_speech(text=pieces(), synthesizer=self.synthesizer, synth_args=self.synth_args, sentence_break='. ')
+        sample = AudioSegment.from_wav('tests/test_files/test.wav')
+
+        self.assertEquals(len(responses.calls), 3)
+        self.assertEquals(audio.frame_count(), sample.frame_count() * 3)
+
+    def test_iter_sentences(self):
+        sentences = list(utils.iter_sentences(['hello.', ' good', 'bye. ', ' . hello'], '. '))
+
+        self.assertEquals(sentences, ['hello', 'goodbye', 'hello'])
+
+    def test_prefetch_error(self):
+        def pieces():
+            yield 'hello'
+            raise IOError('Connection lost')
+
+        with self.assertRaises(IOError):
+            list(utils.prefetch(pieces()))
+
     def test_build_rss_feed(self):
         # This test ignores the pubDate tag in the RSS feed.
         utils.build_rss_feed(self.podcast)
@@ -129,6 +177,14 @@ class TestUtils(unittest.TestCase):
 
         self.assertEquals(feed_string, self.feed_string)
 
+    def test_build_rss_feed_unrendered(self):
+        self.podcast.episodes['Test Episode 1'].length = 0
+        utils.build_rss_feed(self.podcast)
+
+        items = ET.parse('.test_utils/feed.xml').getroot().find('channel').findall('item')
+
+        self.assertEquals(items, [])
+
     def tearDown(self):
         if os.path.exists('.temp.wav'):
             os.remove('.temp.wav')
@@ -1,4 +1,4 @@
 #!/usr/bin/env python
 
-from typecaster.models import Podcast, Episode  # noqa
+from typecaster.models import Podcast, Episode, NOT_MODIFIED  # noqa
 from typecaster.ssml import convert_to_ssml  # noqa
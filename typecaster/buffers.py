@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+
+import mmap
+import tempfile
+import threading
+
+
+class MemoryBudget(object):
+    """
+    Tracks the raw PCM bytes that renders in the process hold in memory.
+
+    :param limit:
+        The maximum number of bytes. Defaults to None for no limit.
+    """
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def reserve(self, size):
+        """
+        Reserve bytes if they fit in the budget. Returns whether they did.
+
+        :param size:
+            The number of bytes to reserve.
+        """
+        with self._lock:
+            if self.limit is not None and self.used + size > self.limit:
+                return False
+
+            self.used += size
+            return True
+
+    def release(self, size):
+        """
+        Give back reserved bytes.
+
+        :param size:
+            The number of bytes to release.
+        """
+        with self._lock:
+            self.used -= size
+
+
+pcm_budget = MemoryBudget()
+
+
+class PCMBuffer(object):
+    """
+    Collects the audio of one render. Audio is kept in memory while
+    :data:`pcm_budget` allows it. Once the budget is exceeded, the buffered
+    audio is moved to a temporary file that is memory-mapped when the audio
+    is assembled, so it is never read back into memory as a whole.
+
+    Use it as a context manager, or call :meth:`close` to release the budget
+    and the temporary file. AudioSegments returned by :meth:`to_segment` are
+    only valid until then.
+
+    :param budget:
+        The :class:`MemoryBudget` to use. Defaults to :data:`pcm_budget`.
+    """
+    def __init__(self, budget=None):
+        self.budget = budget if budget is not None else pcm_budget
+        self.sample_width = None
+        self.frame_rate = None
+        self.channels = None
+
+        self._chunks = []
+        self._reserved = 0
+        self._file = None
+        self._map = None
+
+    @property
+    def spilled(self):
+        """
+        Whether the buffered audio has been moved to a temporary file.
+        """
+        return self._file is not None
+
+    def append(self, segment):
+        """
+        Add an AudioSegment to the end of the buffer. Segments are converted
+        to the sample width, frame rate and channels of the first segment.
+
+        :param segment:
+            The AudioSegment to add.
+        """
+        if self.frame_rate is None:
+            self.sample_width = segment.sample_width
+            self.frame_rate = segment.frame_rate
+            self.channels = segment.channels
+        else:
+            segment = segment.set_sample_width(self.sample_width).set_frame_rate(self.frame_rate).set_channels(self.channels)
+
+        data = segment.raw_data
+        if self._file is None and self.budget.reserve(len(data)):
+            self._chunks.append(data)
+            self._reserved += len(data)
+        else:
+            self._spill()
+            self._file.write(data)
+
+    def _spill(self):
+        if self._file is not None:
+            return
+
+        self._file = tempfile.TemporaryFile()
+        for chunk in self._chunks:
+            self._file.write(chunk)
+
+        self._chunks = []
+        self.budget.release(self._reserved)
+        self._reserved = 0
+
+    def to_segment(self):
+        """
+        Get the buffered audio as one AudioSegment. Spilled audio is backed by
+        a read-only memory map of the temporary file. Audio in memory is only
+        joined if the budget allows a second copy while joining, and is
+        spilled otherwise.
+        """
+        from pydub import AudioSegment
+
+        if self._file is None and len(self._chunks) > 1:
+            # Joining holds the chunks and their copy at the same time, so the
+            # copy needs its own reservation. The chunks are dropped after.
+            if self.budget.reserve(self._reserved):
+                data = b''.join(self._chunks)
+                self._chunks = [data]
+                self.budget.release(self._reserved)
+            else:
+                self._spill()
+
+        if self._file is None:
+            data = self._chunks[0] if self._chunks else b''
+        else:
+            self._file.flush()
+            if self._map is None and self._file.tell() > 0:
+                self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            data = self._map if self._map is not None else b''
+
+        if self.frame_rate is None:
+            return AudioSegment.empty()
+
+        return AudioSegment(data=data, sample_width=self.sample_width, frame_rate=self.frame_rate, channels=self.channels)
+
+    def close(self):
+        """
+        Release the reserved budget and remove the temporary file.
+        """
+        self.budget.release(self._reserved)
+        self._reserved = 0
+        self._chunks = []
+
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+
+import argparse
+import hashlib
+import io
+import json
+import logging
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from typecaster.models import Podcast
+
+logger = logging.getLogger(__name__)
+
+text_formats = {
+    '.html': 'html',
+    '.htm': 'html',
+    '.txt': 'plain'
+}
+
+index_filename = '.typecaster_index.json'
+date_format = '%Y-%m-%d %H:%M:%S'
+
+IndexedEpisode = namedtuple('IndexedEpisode', ['title', 'author', 'summary', 'link', 'length', 'duration',
+                                               'publish_date', 'published'])
+
+
+def file_hash(path):
+    """
+    Get the SHA-1 hex digest of a file's contents.
+
+    :param path:
+        The path to the file.
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as source:
+        for block in iter(lambda: source.read(65536), b''):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def load_index(output_path):
+    """
+    Load the index of rendered documents from the output directory. Returns an
+    empty index if there is none.
+
+    :param output_path:
+        See :class:`typecaster.models.Podcast`.
+    """
+    path = os.path.join(output_path, index_filename)
+    if not os.path.exists(path):
+        return {}
+
+    with open(path) as index_file:
+        return json.load(index_file)
+
+
+def save_index(output_path, index):
+    """
+    Atomically write the index of rendered documents to the output directory.
+
+    :param output_path:
+        See :class:`typecaster.models.Podcast`.
+    :param index:
+        A dictionary of document paths, relative to the source directory,
+        mapped to their index entries.
+    """
+    if not os.path.exists(output_path):
+        os.makedirs(output_path)
+
+    path = os.path.join(output_path, index_filename)
+    with open(path + '.tmp', 'w') as index_file:
+        json.dump(index, index_file, indent=1, sort_keys=True)
+    os.rename(path + '.tmp', path)
+
+
+def scan(source_dir, index):
+    """
+    Find documents in the source directory that are new or have changed since
+    they were indexed. Documents whose modification time and size match the
+    index are skipped without being read. Documents that were only touched get
+    their new modification time recorded in the index.
+
+    Returns a tuple of a list of changed documents, as (relative path, path,
+    modification time, size, hash) tuples, a list of relative paths of indexed
+    documents that no longer exist and a list of relative paths of documents
+    that were only touched.
+
+    :param source_dir:
+        The directory that holds the documents.
+    :param index:
+        See :meth:`save_index`.
+    """
+    changed = []
+    touched = []
+    seen = set()
+
+    for root, dirs, files in os.walk(source_dir):
+        for name in files:
+            if os.path.splitext(name)[1].lower() not in text_formats:
+                continue
+
+            path = os.path.join(root, name)
+            relative_path = os.path.relpath(path, source_dir)
+            seen.add(relative_path)
+
+            stat = os.stat(path)
+            entry = index.get(relative_path)
+            if entry is not None and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+                continue
+
+            digest = file_hash(path)
+            if entry is not None and entry['sha1'] == digest:
+                entry['mtime'] = stat.st_mtime
+                touched.append(relative_path)
+                continue
+
+            changed.append((relative_path, path, stat.st_mtime, stat.st_size, digest))
+
+    removed = [relative_path for relative_path in index if relative_path not in seen]
+
+    return changed, removed, touched
+
+
+def episode_title(relative_path, taken):
+    """
+    Get the episode title of a document from its path. Titles whose mp3 file
+    name is already taken get a numbered suffix, such as 'notes (2)'.
+
+    :param relative_path:
+        The path of the document relative to the source directory.
+    :param taken:
+        A set of the mp3 file names, as made by
+        :meth:`typecaster.models.Podcast.add_episode`, of other episodes.
+    """
+    base_title = os.path.splitext(relative_path)[0].replace(os.sep, ' ')
+    title = base_title
+    number = 2
+    while episode_name(title) in taken:
+        title = base_title + ' (' + str(number) + ')'
+        number += 1
+
+    return title
+
+
+def episode_name(title):
+    """
+    Get the mp3 file name that :meth:`typecaster.models.Podcast.add_episode`
+    uses for an episode title.
+
+    :param title:
+        The title of the episode.
+    """
+    return title.replace(' ', '_').lower()
+
+
+def render(podcast, document, title, author, synthesizer, synth_args, sentence_break):
+    """
+    Render a single document to a published episode and return its index
+    entry.
+
+    :param podcast:
+        The :class:`typecaster.models.Podcast` to add the episode to.
+    :param document:
+        A changed document as returned by :meth:`scan`.
+    :param title:
+        The title of the episode, as returned by :meth:`episode_title`.
+    :param author:
+        See :class:`typecaster.models.Episode`.
+    :param synthesizer:
+        See :meth:`typecaster.utils.text_to_speech`.
+    :param synth_args:
+        See :meth:`typecaster.utils.text_to_speech`.
+    :param sentence_break:
+        See :meth:`typecaster.utils.text_to_speech`.
+    """
+    relative_path, path, mtime, size, digest = document
+    text_format = text_formats[os.path.splitext(path)[1].lower()]
+
+    with io.open(path, encoding='utf-8') as source:
+        text = source.read()
+
+    # Keep the published episode until the new render has succeeded.
+    podcast.add_episode(text, text_format, title, author, synthesizer=synthesizer, synth_args=synth_args,
+                        sentence_break=sentence_break, replace=True)
+    episode = podcast.episodes[title]
+    episode.publish()
+
+    return {
+        'mtime': mtime,
+        'size': size,
+        'sha1': digest,
+        'title': title,
+        'author': episode.author,
+        'link': episode.link,
+        'length': episode.length,
+        'duration': episode.duration,
+        'publish_date': episode.publish_date.strftime(date_format)
+    }
+
+
+def load_episodes(podcast, index):
+    """
+    Add published records for every indexed document to a podcast, so that
+    the feed can be rebuilt without rendering them again.
+
+    :param podcast:
+        See :meth:`render`.
+    :param index:
+        See :meth:`save_index`.
+    """
+    for entry in index.values():
+        podcast.episodes[entry['title']] = IndexedEpisode(entry['title'], entry['author'], None, entry['link'],
+                                                          entry['length'], entry['duration'],
+                                                          datetime.strptime(entry['publish_date'], date_format), True)
+
+
+def run_scan(podcast, source_dir, index, author, synthesizer, synth_args, sentence_break, jobs):
+    """
+    Render every new or changed document in parallel, drop removed documents
+    and rebuild the feed once if anything changed. Returns True if the index
+    changed.
+
+    :param podcast:
+        See :meth:`render`.
+    :param source_dir:
+        See :meth:`scan`.
+    :param index:
+        See :meth:`save_index`.
+    :param author:
+        See :class:`typecaster.models.Episode`.
+    :param synthesizer:
+        See :meth:`typecaster.utils.text_to_speech`.
+    :param synth_args:
+        See :meth:`typecaster.utils.text_to_speech`.
+    :param sentence_break:
+        See :meth:`typecaster.utils.text_to_speech`.
+    :param jobs:
+        The number of documents to render at the same time.
+    """
+    changed, removed, touched = scan(source_dir, index)
+
+    for relative_path in removed:
+        podcast.episodes.pop(index.pop(relative_path)['title'], None)
+
+    # Documents that were rendered before keep their title. New documents get
+    # titles that no other document uses, so their mp3 files do not collide.
+    taken = set(episode_name(entry['title']) for entry in index.values())
+    titles = {}
+    for document in sorted(changed):
+        if document[0] in index:
+            titles[document[0]] = index[document[0]]['title']
+        else:
+            titles[document[0]] = episode_title(document[0], taken)
+            taken.add(episode_name(titles[document[0]]))
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [(document, executor.submit(render, podcast, document, titles[document[0]], author, synthesizer,
+                                              synth_args, sentence_break))
+                   for document in changed]
+
+        rendered = 0
+        for document, future in futures:
+            try:
+                index[document[0]] = future.result()
+                rendered += 1
+            except Exception:
+                # Leave the document out of the index so the next scan retries it.
+                logger.exception('Failed to render ' + document[1])
+
+    if rendered or removed or not os.path.exists(os.path.join(podcast.output_path, 'feed.xml')):
+        podcast.update_rss_feed()
+
+    logger.info('%d rendered, %d removed, %d failed', rendered, len(removed), len(changed) - rendered)
+
+    return bool(rendered or removed or touched)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog='typecaster',
+                                     description='Render new and changed .html, .htm and .txt documents in a '
+                                                 'directory to podcast episodes.')
+    parser.add_argument('source_dir', help='The directory that holds the documents.')
+    parser.add_argument('output_path', help='The directory for mp3 files and the RSS feed.')
+    parser.add_argument('--title', required=True, help='The title of the podcast.')
+    parser.add_argument('--link', required=True, help='The URL of the podcast.')
+    parser.add_argument('--author', required=True, help='The author of the podcast and its episodes.')
+    parser.add_argument('--description', default='', help='A description of the podcast.')
+    parser.add_argument('--synthesizer', default='watson', help='The text-to-speech synthesizer to use.')
+    parser.add_argument('--synth-args', help='A JSON file of synthesizer arguments and credentials.')
+    parser.add_argument('--sentence-break', default='. ', help="The sentence break of the documents. Defaults to '. '.")
+    parser.add_argument('--jobs', type=int, default=4, help='The number of documents to render at the same time.')
+    parser.add_argument('--watch', type=float, metavar='SECONDS',
+                        help='Keep running and scan the directory again every SECONDS seconds.')
+    options = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    synth_args = None
+    if options.synth_args is not None:
+        with open(options.synth_args) as synth_args_file:
+            synth_args = json.load(synth_args_file)
+
+    podcast = Podcast(options.title, options.link, options.author, options.description, options.output_path,
+                      update_feed=False)
+    index = load_index(options.output_path)
+    load_episodes(podcast, index)
+
+    while True:
+        if run_scan(podcast, options.source_dir, index, options.author, options.synthesizer, synth_args,
+                    options.sentence_break, options.jobs):
+            save_index(options.output_path, index)
+
+        if options.watch is None:
+            break
+        time.sleep(options.watch)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,26 @@
 #!/usr/bin/env python
 
+import errno
+import hashlib
+import itertools
+import logging
 import os
 import six
+import threading
 from collections import Sequence
-from apscheduler.schedulers.background import BackgroundScheduler
-from datetime import datetime
+from datetime import datetime, timedelta
 
-from typecaster.ssml import convert_to_ssml
-from typecaster.utils import text_to_speech, build_rss_feed
+from typecaster.buffers import PCMBuffer
+from typecaster.scheduling import job_service as default_job_service
+from typecaster.ssml import convert_to_ssml, compact_ssml, compact_pieces
+from typecaster.utils import text_to_speech, iter_speech, encode_mp3, build_rss_feed, fragment_pattern
+
+logger = logging.getLogger(__name__)
+
+# Returned by a scheduled job's text source when its text has not changed.
+NOT_MODIFIED = object()
+
+dedupe_policies = ('skip', 'republish')
 
 
 class Podcast(object):
@@ -40,15 +53,27 @@ class Podcast(object):
         sequence.
     :param copyright:
         The copyright of the podcast. Defaults to None.
+    :param update_feed:
+        Whether to write the RSS feed when the podcast is created. Set to False
+        to defer writing until the first call to :meth:`update_rss_feed`.
+        Defaults to True.
+    :param job_service:
+        The :class:`typecaster.scheduling.JobService` that runs the podcast's
+        scheduled jobs. Defaults to the service shared by every podcast in the
+        process.
     :param episodes:
         A dictionary of titles mapped to Episode models for each episode in the
         podcast.
     :param scheduled_jobs:
         A dictionary of titles mapped to scheduled jobs stored in the
         :class:`Podcast`.
+    :param fragments:
+        A dictionary of names mapped to pre-rendered AudioSegments that
+        episodes can reference with placeholders. See :meth:`add_fragment`.
     """
     def __init__(self, title, link, author, description, output_path, language='en-us',
-                 subtitle=None, owner_name=None, owner_email=None, image=None, categories=[], copyright=None):
+                 subtitle=None, owner_name=None, owner_email=None, image=None, categories=[], copyright=None,
+                 update_feed=True, job_service=None):
         self.title = title
         self.link = link
         self.author = author
@@ -64,11 +89,16 @@ class Podcast(object):
 
         self.episodes = {}
         self.scheduled_jobs = {}
-        self.update_rss_feed()
-        self._scheduler = BackgroundScheduler()
+        self.fragments = {}
+
+        self._scheduler = job_service if job_service is not None else default_job_service
+
+        if update_feed:
+            self.update_rss_feed()
 
     def add_episode(self, text, text_format, title, author, summary=None,
-                    publish_date=None, synthesizer='watson', synth_args=None, sentence_break='. '):
+                    publish_date=None, synthesizer='watson', synth_args=None, sentence_break='. ',
+                    priority='interactive', compact=True, render=True, replace=False):
         """
         Add a new episode to the podcast.
 
@@ -90,28 +120,106 @@ class Podcast(object):
             See :meth:`typecaster.utils.text_to_speech`.
         :param sentence_break:
             See :meth:`typecaster.utils.text_to_speech`.
+        :param priority:
+            See :meth:`typecaster.utils.text_to_speech`.
+        :param compact:
+            Whether to remove markup, whitespace and entities that are not
+            spoken before synthesis. Text with a text_format of None is
+            treated as SSML and keeps all of its tags. See
+            :meth:`typecaster.ssml.compact_ssml`. Defaults to True.
+        :param render:
+            See :meth:`Episode`.
+        :param replace:
+            Whether to replace an existing episode with the same title. The
+            existing episode is kept until the new one has been created.
+            Defaults to False.
         """
-        if title in self.episodes:
+        if title in self.episodes and not replace:
             raise ValueError('"' + title + '" already exists as an episode title.')
 
+        # Episodes may be added from several threads at once.
+        try:
+            os.makedirs(self.output_path)
+        except OSError as error:
+            if error.errno != errno.EEXIST:
+                raise
+
         link = self.output_path + '/' + title.replace(' ', '_').lower() + '.mp3'
-        episode_text = convert_to_ssml(text, text_format)
-        new_episode = Episode(episode_text, text_format, title, author, link, summary, publish_date, synthesizer, synth_args, sentence_break)
+        if isinstance(text, six.string_types):
+            episode_text = convert_to_ssml(text, text_format)
+            if compact:
+                episode_text, characters_saved = compact_ssml(episode_text, sentence_break, text_format is not None)
+                logger.info('Compacting "%s" saved %d characters.', title, characters_saved)
+        elif compact:
+            def log_savings(characters_saved):
+                logger.info('Compacting "%s" saved %d characters.', title, characters_saved)
+
+            episode_text = compact_pieces((convert_to_ssml(piece, text_format) for piece in text), sentence_break,
+                                          text_format is not None, log_savings)
+        else:
+            episode_text = text
+        new_episode = Episode(episode_text, text_format, title, author, link, summary, publish_date, synthesizer, synth_args, sentence_break, self.fragments, priority,
+                              render)
 
         self.episodes[title] = new_episode
 
+    def add_fragment(self, name, text=None, text_format=None, audio_path=None,
+                     synthesizer='watson', synth_args=None, sentence_break='. '):
+        """
+        Register a reusable audio fragment, such as an intro or outro. Episodes
+        reference fragments with placeholders like '{{intro}}' in their text and
+        the cached audio is spliced in without calling the synthesizer again.
+
+        :param name:
+            The name used in placeholders. Must contain only letters, digits
+            and underscores.
+        :param text:
+            Text that is synthesized once when the fragment is added. Either
+            text or audio_path must be given.
+        :param text_format:
+            See :meth:`Episode`.
+        :param audio_path:
+            The path to an existing audio file to use as the fragment. The
+            format is inferred from the file extension.
+        :param synthesizer:
+            See :meth:`typecaster.utils.text_to_speech`.
+        :param synth_args:
+            See :meth:`typecaster.utils.text_to_speech`.
+        :param sentence_break:
+            See :meth:`typecaster.utils.text_to_speech`.
+        """
+        match = fragment_pattern.match('{{' + name + '}}')
+        if match is None or match.group(1) != name:
+            raise ValueError('"' + name + '" is not a valid fragment name.')
+        if (text is None) == (audio_path is None):
+            raise ValueError('Exactly one of "text" or "audio_path" must be given.')
+
+        if audio_path is not None:
+            from pydub import AudioSegment
+            segment = AudioSegment.from_file(audio_path)
+        else:
+            segment = text_to_speech(convert_to_ssml(text, text_format), synthesizer, synth_args, sentence_break)
+
+        self.fragments[name] = segment
+
     def add_scheduled_job(self, text_source, cron_args, text_format, title, author, summary=None,
-                          synthesizer='watson', synth_args=None, sentence_break='. '):
+                          synthesizer='watson', synth_args=None, sentence_break='. ', priority='batch', dedupe=None,
+                          lead_time=None, compact=True):
         """
         Add and start a new scheduled job to dynamically generate podcasts.
 
         Note: scheduling will end when the process ends. This works best when run
-        inside an existing application.
+        inside an existing application. Jobs of every podcast share one
+        :class:`typecaster.scheduling.JobService`.
 
         :param text_source:
             A function that generates podcast text. Examples: a function that
             opens a file with today's date as a filename or a function that
-            requests a specific url and extracts the main text.
+            requests a specific url and extracts the main text. The function
+            can also return an iterable of text pieces, or be a generator
+            function, so that fetching and synthesis overlap. Return
+            :data:`NOT_MODIFIED` to report cheaply that the text has not
+            changed since the last run.
             Also see :meth:`Episode`.
         :param cron_args:
             A dictionary of cron parameters. Keys can be: 'year', 'month',
@@ -134,20 +242,91 @@ class Podcast(object):
             See :meth:`typecaster.utils.text_to_speech`.
         :param sentence_break:
             See :meth:`typecaster.utils.text_to_speech`.
+        :param priority:
+            See :meth:`typecaster.utils.text_to_speech`. Defaults to 'batch' so
+            scheduled renders yield to interactive ones.
+        :param dedupe:
+            What to do when the text source returns the same text as the last
+            run, or :data:`NOT_MODIFIED`. 'skip' synthesizes nothing and
+            'republish' moves the publish date of the last episode to now.
+            Defaults to None, which synthesizes a new episode every run unless
+            the text source returns :data:`NOT_MODIFIED`. Text is compared by
+            a hash, so only text sources that return strings are deduplicated.
+        :param lead_time:
+            The number of seconds before each cron time to fetch the text and
+            render the episode. At the cron time the prepared episode is only
+            published, so it goes live in the feed on schedule. If nothing was
+            prepared, the episode is rendered and published at the cron time.
+            Defaults to None, which renders at the cron time without
+            publishing.
+        :param compact:
+            See :meth:`add_episode`.
         """
         if not callable(text_source):
             raise TypeError('Argument "text" must be a function')
+        if dedupe is not None and dedupe not in dedupe_policies:
+            raise ValueError('"' + str(dedupe) + '" dedupe policy not found.')
+
+        last_run = {'hash': None, 'title': None}
+        prepared = {}
+        lock = threading.Lock()
+
+        def unchanged():
+            last_episode = self.episodes.get(last_run['title'])
+            if dedupe == 'republish' and last_episode is not None:
+                last_episode.publish_date = datetime.utcnow()
+                if last_episode.published:
+                    self.update_rss_feed()
+
+        def render(publish_date):
+            # Returns the new episode's title, or None if the text is unchanged.
+            episode_text = text_source()
+            if episode_text is NOT_MODIFIED:
+                return None
+
+            text_hash = None
+            if dedupe is not None and isinstance(episode_text, six.string_types):
+                encoded_text = episode_text.encode('utf-8') if isinstance(episode_text, six.text_type) else episode_text
+                text_hash = hashlib.sha1(encoded_text).hexdigest()
+                if text_hash == last_run['hash'] and last_run['title'] in self.episodes:
+                    return None
+
+            episode_title = title + '_' + publish_date.strftime('%Y%m%d%H%M%S')
+
+            self.add_episode(episode_text, text_format, episode_title, author, summary, publish_date, synthesizer, synth_args, sentence_break, priority,
+                             compact)
+            last_run['hash'] = text_hash
+            last_run['title'] = episode_title
+
+            return episode_title
 
         def add_episode():
-            episode_text = text_source()
-            episode_title = title + '_' + datetime.utcnow().strftime('%Y%m%d%H%M%S')
+            with lock:
+                if 'title' in prepared:
+                    episode_title = prepared.pop('title')
+                else:
+                    episode_title = render(datetime.utcnow())
+
+                if episode_title is None:
+                    unchanged()
+                elif lead_time is not None:
+                    self.publish(episode_title)
+
+        def prepare():
+            with lock:
+                publish_time = self.scheduled_jobs[title].next_run_time
+                if publish_time is None:
+                    return
 
-            self.add_episode(episode_text, text_format, episode_title, author, summary, datetime.utcnow(), synthesizer, synth_args, sentence_break)
+                # Episode publish dates are naive UTC datetimes.
+                publish_date = (publish_time - publish_time.utcoffset()).replace(tzinfo=None)
+                prepared['title'] = render(publish_date)
 
-        self.scheduled_jobs[title] = self._scheduler.add_job(add_episode, 'cron', id=title, **cron_args)
+        job_id = self.output_path + '/' + title
+        self.scheduled_jobs[title] = self._scheduler.add_job(add_episode, 'cron', id=job_id, **cron_args)
 
-        if not self._scheduler.running:
-            self._scheduler.start()
+        if lead_time is not None:
+            self._scheduler.add_job(prepare, 'cron', id=job_id + '/prepare', lead_time=timedelta(seconds=lead_time), **cron_args)
 
     def publish(self, titles):
         """
@@ -197,7 +376,10 @@ class Episode(object):
     The model that holds the information for a single podcast episode.
 
     :param text:
-        The text of the episode that will be synthesized to audio.
+        The text of the episode that will be synthesized to audio. Can also be
+        an iterable of text pieces that are converted to SSML one at a time
+        and synthesized as they arrive. See
+        :meth:`typecaster.utils.text_to_speech`.
     :param text_format:
         The format of input text. Can be 'html', 'plain' or None. None will
         skip converting to SSML.
@@ -218,8 +400,26 @@ class Episode(object):
         See :meth:`typecaster.utils.text_to_speech`.
     :param synth_args:
         See :meth:`typecaster.utils.text_to_speech`.
+    :param sentence_break:
+        See :meth:`typecaster.utils.text_to_speech`.
+    :param fragments:
+        See :meth:`typecaster.utils.text_to_speech`.
+    :param priority:
+        See :meth:`typecaster.utils.text_to_speech`.
+    :param render:
+        Whether to render the episode's audio when it is created. Set to False
+        to render it on the first call to :meth:`stream` instead, which plays
+        the audio while it is synthesized. Defaults to True.
+
+    The episode's SSML text is kept on disk next to its mp3 file, see
+    :attr:`text_path`, and is only read when the audio is rendered again.
     """
-    def __init__(self, text, text_format, title, author, link, summary=None, publish_date=None, synthesizer='watson', synth_args=None, sentence_break='. '):
+    __slots__ = ('text_format', 'title', 'author', 'link', 'summary', 'publish_date', 'published', 'length', 'duration',
+                 'synthesizer', 'synth_args', 'sentence_break', 'fragments', 'priority', '_pending_text',
+                 '_text_lock', '_text_owner')
+
+    def __init__(self, text, text_format, title, author, link, summary=None, publish_date=None, synthesizer='watson', synth_args=None, sentence_break='. ',
+                 fragments=None, priority='interactive', render=True):
         self.text_format = text_format
         self.title = title
         self.author = author
@@ -237,47 +437,201 @@ class Episode(object):
         self.synthesizer = synthesizer
         self.synth_args = synth_args
         self.sentence_break = sentence_break
+        self.fragments = fragments
+        self.priority = priority
+        self._pending_text = None
+        self._text_lock = threading.Lock()
+        self._text_owner = None
+
+        if isinstance(text, six.string_types):
+            self._write_text(convert_to_ssml(text, self.text_format))
+            if render:
+                self.render_audio()
+        else:
+            self._discard_text()
+            self._pending_text = (convert_to_ssml(piece, self.text_format) for piece in text)
+            if render:
+                try:
+                    self._render(self._resume_text())
+                except Exception:
+                    self._discard_text()
+                    raise
 
-        self._text = convert_to_ssml(text, self.text_format)
-
-        self.render_audio()
+    @property
+    def text_path(self):
+        """
+        Get the path to the file that holds the SSML text of the episode.
+        """
+        return os.path.splitext(self.link)[0] + '.ssml'
 
     @property
     def text(self):
         """
-        Get the text of the episode.
+        Get the text of the episode. Text that is still arriving in pieces is
+        read to the end first.
         """
-        return self._text
+        if self._pending_text is not None:
+            for piece in self._resume_text():
+                pass
+
+        with open(self.text_path, 'rb') as text_file:
+            return text_file.read().decode('utf-8')
 
     @text.setter
     def text(self, value):
         """
         Set the text of the episode. This will rerender the episode's audio.
         """
-        self._text = value
+        self._write_text(value)
 
         self.render_audio()
 
+    def _write_text(self, text):
+        if isinstance(text, six.text_type):
+            text = text.encode('utf-8')
+
+        with open(self.text_path, 'wb') as text_file:
+            text_file.write(text)
+
+    def _resume_text(self):
+        # Get the text recorded so far followed by the pieces that have not
+        # arrived yet. A render that was interrupted stops recording, so an
+        # earlier stream of the episode cannot take pieces from this one.
+        with self._text_lock:
+            owner = self._text_owner = object()
+            recorded = b''
+            if os.path.exists(self.text_path + '.part'):
+                with open(self.text_path + '.part', 'rb') as text_file:
+                    recorded = text_file.read()
+
+        pieces = self._record_text(self._pending_text, owner)
+        if recorded:
+            return itertools.chain([recorded.decode('utf-8')], pieces)
+        return pieces
+
+    def _record_text(self, pieces, owner):
+        # Save streamed text while it passes through to the synthesizer. It
+        # only replaces the text file once every piece has arrived, so an
+        # interrupted render leaves no truncated text behind.
+        while True:
+            with self._text_lock:
+                if self._text_owner is not owner:
+                    raise RuntimeError('"' + self.title + '" text is being read by another render.')
+
+                try:
+                    piece = next(pieces)
+                except StopIteration:
+                    open(self.text_path + '.part', 'ab').close()
+                    os.rename(self.text_path + '.part', self.text_path)
+                    self._pending_text = None
+                    return
+
+                with open(self.text_path + '.part', 'ab') as text_file:
+                    text_file.write(piece.encode('utf-8') if isinstance(piece, six.text_type) else piece)
+
+            yield piece
+
+    def _discard_text(self):
+        with self._text_lock:
+            self._text_owner = None
+            if os.path.exists(self.text_path + '.part'):
+                os.remove(self.text_path + '.part')
+
     def render_audio(self):
         """
         Synthesize audio from the episode's text.
         """
-        segment = text_to_speech(self._text, self.synthesizer, self.synth_args, self.sentence_break)
+        self._render(self.text)
+
+    def _render(self, text):
+        # Collect the synthesized audio within the process-wide PCM budget,
+        # spilling to a temporary file when too many renders are in flight.
+        with PCMBuffer() as buffer:
+            for segment in iter_speech(text, self.synthesizer, self.synth_args, self.sentence_break, self.fragments, self.priority):
+                buffer.append(segment)
+
+            segment = buffer.to_segment()
+            self._set_duration(len(segment))
+
+            segment.export(self.link, format='mp3')
+            del segment
+
+        self.length = os.path.getsize(self.link)
 
-        milli = len(segment)
+    def _set_duration(self, milli):
         seconds = '{0:.1f}'.format(float(milli) / 1000 % 60).zfill(2)
         minutes = '{0:.0f}'.format((milli / (1000 * 60)) % 60).zfill(2)
         hours = '{0:.0f}'.format((milli / (1000 * 60 * 60)) % 24).zfill(2)
         self.duration = hours + ':' + minutes + ':' + seconds
 
-        segment.export(self.link, format='mp3')
+    def stream(self, chunk_size=65536):
+        """
+        Yield the episode's audio as mp3 bytes. The returned generator can be
+        used directly as a WSGI response body.
+
+        If the audio has not been rendered yet, see the render parameter of
+        :class:`Episode`, it is synthesized one sentence at a time and each
+        sentence is yielded as soon as it is ready, while it is also written
+        to the episode's mp3 file. Once rendered, the mp3 file is served
+        without synthesizing again.
+
+        :param chunk_size:
+            The number of bytes to read at a time from a rendered mp3 file.
+            Defaults to 65536.
+        """
+        if self.length:
+            with open(self.link, 'rb') as audio:
+                for data in iter(lambda: audio.read(chunk_size), b''):
+                    yield data
+            return
+
+        text = self._resume_text() if self._pending_text is not None else self.text
+        speech = iter_speech(text, self.synthesizer, self.synth_args, self.sentence_break, self.fragments, self.priority)
+        milli = 0
+
+        # Write to a temporary file so an interrupted stream leaves no partial
+        # episode behind. Text that was read before the interruption is kept,
+        # and the next stream continues with the rest of it.
+        partial_link = self.link + '.part'
+        finished = False
+        try:
+            with open(partial_link, 'wb') as audio:
+                for segment in speech:
+                    data = encode_mp3(segment)
+                    audio.write(data)
+                    milli += len(segment)
+                    yield data
+            finished = True
+        finally:
+            speech.close()
+            if not finished and os.path.exists(partial_link):
+                os.remove(partial_link)
+
+        os.rename(partial_link, self.link)
+        self._set_duration(milli)
         self.length = os.path.getsize(self.link)
 
+    def stream_to(self, fileobj):
+        """
+        Write the episode's audio to a file-like object as mp3 bytes while it
+        is synthesized. See :meth:`stream`.
+
+        :param fileobj:
+            A file-like object opened for writing bytes.
+        """
+        for data in self.stream():
+            fileobj.write(data)
+            if hasattr(fileobj, 'flush'):
+                fileobj.flush()
+
     def publish(self):
         """
-        Mark an episode as published.
+        Mark an episode as published. Episodes whose audio has not been
+        rendered yet can not be published.
         """
-        if self.published is False:
+        if not self.length:
+            raise Warning(self.title + ' has not been rendered yet.')
+        elif self.published is False:
             self.published = True
         else:
             raise Warning(self.title + ' is already published.')
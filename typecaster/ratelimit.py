@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+
+import heapq
+import itertools
+import threading
+import time
+
+clock = getattr(time, 'monotonic', time.time)
+
+priorities = {
+    'interactive': 0,
+    'batch': 1
+}
+
+
+class ThrottledError(Exception):
+    """
+    Raised when the synthesizer still answers with a 429 after every retry.
+
+    :param response:
+        The last response from the synthesizer.
+    """
+    def __init__(self, response):
+        super(ThrottledError, self).__init__('The synthesizer is still rate limiting requests after all retries.')
+        self.response = response
+
+
+class TokenBucket(object):
+    """
+    A token bucket that refills continuously at a fixed rate.
+
+    :param rate:
+        The number of tokens added per second.
+    :param capacity:
+        The maximum number of tokens the bucket holds. Defaults to one second
+        of tokens.
+    """
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self.tokens = self.capacity
+        self._updated = clock()
+
+    def _refill(self):
+        now = clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self, cost):
+        """
+        Get the number of seconds until the bucket can pay for a cost. Costs
+        larger than the capacity only wait for a full bucket.
+
+        :param cost:
+            The number of tokens needed.
+        """
+        self._refill()
+        needed = min(float(cost), self.capacity) - self.tokens
+        if needed <= 0:
+            return 0
+        return needed / self.rate
+
+    def consume(self, cost):
+        """
+        Take tokens from the bucket. The balance may go negative for costs
+        larger than the capacity, which delays the requests that follow.
+
+        :param cost:
+            The number of tokens to take.
+        """
+        self._refill()
+        self.tokens -= cost
+
+
+class SynthesisScheduler(object):
+    """
+    Shares synthesizer traffic between every :class:`typecaster.models.Podcast`
+    in a process. Requests wait for a character and request budget, run with
+    an adaptive concurrency limit and are served in priority order.
+
+    The concurrency limit grows by one request per window of successful
+    requests and is halved when the synthesizer answers with a 429 or the
+    latency exceeds target_latency (AIMD).
+
+    :param characters_per_second:
+        The character budget of the synthesizer. Defaults to None for no
+        budget.
+    :param requests_per_second:
+        The request budget of the synthesizer. Defaults to None for no budget.
+    :param concurrency:
+        The initial number of concurrent requests. Defaults to 4.
+    :param max_concurrency:
+        The upper bound of the concurrency limit. Defaults to 16.
+    :param target_latency:
+        The request latency in seconds above which concurrency is reduced.
+        Defaults to 10.
+    :param max_retries:
+        The number of times a request that was answered with a 429 is
+        retried. Defaults to 5.
+    """
+    def __init__(self, characters_per_second=None, requests_per_second=None, concurrency=4,
+                 max_concurrency=16, target_latency=10, max_retries=5):
+        self._condition = threading.Condition()
+        self._waiting = []
+        self._counter = itertools.count()
+        self._in_flight = 0
+        self._last_decrease = 0
+        self.configure(characters_per_second, requests_per_second, concurrency, max_concurrency, target_latency, max_retries)
+
+    def configure(self, characters_per_second=None, requests_per_second=None, concurrency=4,
+                  max_concurrency=16, target_latency=10, max_retries=5):
+        """
+        Replace the budgets and limits of the scheduler. Requests that are in
+        flight are not affected.
+
+        See :class:`SynthesisScheduler` for the parameters.
+        """
+        with self._condition:
+            self.characters = TokenBucket(characters_per_second) if characters_per_second else None
+            self.requests = TokenBucket(requests_per_second) if requests_per_second else None
+            self.concurrency = float(concurrency)
+            self.max_concurrency = max_concurrency
+            self.target_latency = target_latency
+            self.max_retries = max_retries
+            self._condition.notify_all()
+
+    def submit(self, request, cost=1, priority='interactive'):
+        """
+        Run a synthesizer request once the budgets and concurrency limit allow
+        it, retrying requests that were answered with a 429. Raises
+        :class:`ThrottledError` if the last retry is still answered with a 429.
+
+        :param request:
+            A function without arguments that makes the request and returns a
+            requests Response.
+        :param cost:
+            The number of characters sent with the request.
+        :param priority:
+            Either 'interactive' or 'batch'. Waiting interactive requests are
+            always served before batch requests.
+        """
+        if priority not in priorities:
+            raise ValueError('"' + str(priority) + '" priority not found.')
+
+        for attempt in range(self.max_retries + 1):
+            self._acquire(cost, priorities[priority])
+            start = clock()
+            try:
+                response = request()
+            except Exception:
+                self._release(None, False)
+                raise
+
+            throttled = getattr(response, 'status_code', None) == 429
+            self._release(clock() - start, throttled)
+            if not throttled:
+                return response
+
+            if attempt < self.max_retries:
+                time.sleep(self._retry_delay(response, attempt))
+
+        raise ThrottledError(response)
+
+    def _budget_delay(self, cost):
+        delays = [0]
+        if self.characters is not None:
+            delays.append(self.characters.delay(cost))
+        if self.requests is not None:
+            delays.append(self.requests.delay(1))
+        return max(delays)
+
+    def _acquire(self, cost, rank):
+        entry = (rank, next(self._counter))
+        with self._condition:
+            heapq.heappush(self._waiting, entry)
+            try:
+                while True:
+                    if self._waiting[0] == entry and self._in_flight < max(1, int(self.concurrency)):
+                        delay = self._budget_delay(cost)
+                        if delay <= 0:
+                            break
+                        self._condition.wait(delay)
+                    else:
+                        self._condition.wait()
+            finally:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._condition.notify_all()
+
+            if self.characters is not None:
+                self.characters.consume(cost)
+            if self.requests is not None:
+                self.requests.consume(1)
+            self._in_flight += 1
+
+    def _release(self, latency, throttled):
+        with self._condition:
+            self._in_flight -= 1
+
+            if latency is not None:
+                now = clock()
+                if throttled or latency > self.target_latency:
+                    # Only back off once per round trip for a burst of failures.
+                    if now - self._last_decrease > latency:
+                        self.concurrency = max(1.0, self.concurrency / 2)
+                        self._last_decrease = now
+                else:
+                    self.concurrency = min(float(self.max_concurrency), self.concurrency + 1 / self.concurrency)
+
+            self._condition.notify_all()
+
+    def _retry_delay(self, response, attempt):
+        retry_after = getattr(response, 'headers', {}).get('Retry-After')
+        try:
+            return float(retry_after)
+        except (TypeError, ValueError):
+            return 0.5 * 2 ** attempt
+
+
+synthesis_scheduler = SynthesisScheduler()
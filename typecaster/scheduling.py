@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+
+import threading
+
+
+class JobService(object):
+    """
+    Runs the scheduled jobs of every :class:`typecaster.models.Podcast` in a
+    process with a single scheduler thread and one bounded worker pool, so the
+    number of threads does not grow with the number of podcasts. The scheduler
+    is created and started when the first job is added.
+
+    :param max_workers:
+        The maximum number of jobs that run at the same time. Defaults to 10.
+    :param misfire_grace_time:
+        The number of seconds a job may start late, for example while it
+        waits for a free worker, before the run is skipped. Defaults to None
+        to never skip a run.
+    """
+    def __init__(self, max_workers=10, misfire_grace_time=None):
+        self.max_workers = max_workers
+        self.misfire_grace_time = misfire_grace_time
+        self._scheduler = None
+        self._lock = threading.RLock()
+
+    @property
+    def scheduler(self):
+        """
+        Get the underlying APScheduler BackgroundScheduler.
+        """
+        with self._lock:
+            if self._scheduler is None:
+                from apscheduler.executors.pool import ThreadPoolExecutor
+                from apscheduler.schedulers.background import BackgroundScheduler
+                self._scheduler = BackgroundScheduler(executors={'default': ThreadPoolExecutor(self.max_workers)},
+                                                      job_defaults={'coalesce': True, 'max_instances': 1,
+                                                                    'misfire_grace_time': self.misfire_grace_time})
+
+            return self._scheduler
+
+    @property
+    def running(self):
+        """
+        Whether the scheduler is started. Paused schedulers are still running.
+        """
+        return self._scheduler is not None and self._scheduler.running
+
+    def add_job(self, func, trigger, id, lead_time=None, **trigger_args):
+        """
+        Add a job and start the scheduler if it is not running yet.
+
+        :param func:
+            The function to run.
+        :param trigger:
+            The APScheduler trigger, such as 'cron', or a trigger instance.
+        :param id:
+            The unique id of the job.
+        :param lead_time:
+            A timedelta. If given, the job runs this long before each time the
+            trigger fires. Defaults to None.
+        :param trigger_args:
+            Arguments for the trigger, such as cron fields.
+        """
+        with self._lock:
+            if lead_time is not None:
+                trigger = lead_trigger(self.scheduler._create_trigger(trigger, trigger_args), lead_time)
+                trigger_args = {}
+
+            job = self.scheduler.add_job(func, trigger, id=id, **trigger_args)
+            if not self._scheduler.running:
+                self._scheduler.start()
+
+            return job
+
+    def remove_job(self, id):
+        """
+        Remove a job.
+
+        :param id:
+            The id of the job to remove.
+        """
+        self.scheduler.remove_job(id)
+
+    def get_jobs(self):
+        """
+        Get every job of every podcast in the process.
+        """
+        if self._scheduler is None:
+            return []
+
+        return self._scheduler.get_jobs()
+
+    def pause(self):
+        """
+        Stop starting new jobs. Jobs that are already running continue.
+        """
+        if self.running:
+            self._scheduler.pause()
+
+    def resume(self):
+        """
+        Resume starting jobs after :meth:`pause`.
+        """
+        if self.running:
+            self._scheduler.resume()
+
+    def shutdown(self, wait=True):
+        """
+        Remove all jobs and stop the scheduler. A new scheduler is created if
+        jobs are added afterwards.
+
+        :param wait:
+            Whether to wait for running jobs to finish. Defaults to True.
+        """
+        with self._lock:
+            if self.running:
+                self._scheduler.pause()
+                self._scheduler.remove_all_jobs()
+                self._scheduler.shutdown(wait=wait)
+
+            self._scheduler = None
+
+
+def lead_trigger(trigger, lead_time):
+    """
+    Get an APScheduler trigger that fires a fixed time before another trigger.
+
+    :param trigger:
+        The APScheduler trigger instance to run ahead of.
+    :param lead_time:
+        A timedelta.
+    """
+    from apscheduler.triggers.base import BaseTrigger
+
+    class LeadTrigger(BaseTrigger):
+        def get_next_fire_time(self, previous_fire_time, now):
+            if previous_fire_time is not None:
+                previous_fire_time += lead_time
+
+            fire_time = trigger.get_next_fire_time(previous_fire_time, now + lead_time)
+            if fire_time is None:
+                return None
+
+            return fire_time - lead_time
+
+        def __str__(self):
+            return str(trigger) + ' - ' + str(lead_time)
+
+    return LeadTrigger()
+
+
+job_service = JobService()
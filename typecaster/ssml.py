@@ -1,7 +1,14 @@
 #!/usr/bin/env python
 
+import re
 from six.moves import reduce
 
+try:
+    from html import unescape
+except ImportError:
+    from six.moves.html_parser import HTMLParser
+    unescape = HTMLParser().unescape
+
 html_to_ssml_maps = {
     '<h1>': '<prosody rate="slow" volume="95"><break time="1s" />',
     '</h1>': '</prosody>',
@@ -15,6 +22,37 @@ html_to_ssml_maps = {
     '</b>': '</emphasis>'
 }
 
+ssml_tags = set(['speak', 'p', 's', 'paragraph', 'sentence', 'break', 'prosody', 'emphasis', 'say-as', 'phoneme',
+                 'sub', 'audio', 'mark', 'voice', 'lang', 'desc', 'express-as', 'voice-transformation'])
+
+# SSML tags that are also HTML tags. In HTML they are only kept as SSML when
+# they carry the attribute that SSML requires.
+html_tags = set(['s', 'sub', 'mark', 'audio', 'desc'])
+ssml_required_attributes = {
+    'sub': 'alias',
+    'mark': 'name',
+    'audio': 'src'
+}
+
+# HTML elements that can sit inside a word, so removing them must not add a
+# space.
+inline_tags = set(['a', 'abbr', 'b', 'bdi', 'bdo', 'cite', 'code', 'data', 'del', 'dfn', 'em', 'font', 'i', 'ins',
+                   'kbd', 'mark', 'q', 's', 'samp', 'small', 'span', 'strike', 'strong', 'sub', 'sup', 'time', 'tt',
+                   'u', 'var', 'wbr'])
+
+# Elements whose content is never spoken.
+non_spoken_elements = 'script|style|noscript|template|nav|footer|aside|form|iframe|svg'
+non_spoken_pattern = re.compile(r'<(' + non_spoken_elements + r')\b[^>]*>.*?</\1\s*>', re.DOTALL | re.IGNORECASE)
+non_spoken_start_pattern = re.compile(r'<(' + non_spoken_elements + r')\b', re.IGNORECASE)
+comment_pattern = re.compile(r'<!--.*?-->', re.DOTALL)
+tag_pattern = re.compile(r'</?([A-Za-z][\w:-]*)[^>]*>')
+entity_pattern = re.compile(r'&(#[0-9]+|#[xX][0-9a-fA-F]+|[A-Za-z][A-Za-z0-9]*);')
+empty_element_pattern = re.compile(r'<(paragraph|p|s|sentence|emphasis|prosody)\b[^>]*>\s*</\1>')
+whitespace_pattern = re.compile(r'\s+')
+
+# Entities that must stay escaped to keep the SSML valid.
+xml_entities = set(['amp', 'lt', 'gt', 'quot', 'apos', '#38', '#60', '#62', '#x26', '#x3c', '#x3e', '#X26', '#X3C', '#X3E'])
+
 
 def convert_to_ssml(text, text_format):
     """
@@ -37,6 +75,153 @@ def convert_to_ssml(text, text_format):
         raise ValueError(text_format + ': text format not found.')
 
 
+def compact_ssml(text, sentence_break='. ', strip_tags=True):
+    """
+    Remove everything from SSML text that is not spoken but would still be
+    sent to, and billed by, the synthesizer: comments, non-spoken HTML
+    elements such as <script> and <nav> with their content, tags that are not
+    SSML, entities that can be written as plain characters, empty elements and
+    repeated whitespace. Sentence breaks are kept as they are, so the text is
+    split into the same requests.
+
+    Returns a tuple of the compacted text and the number of characters saved.
+
+    :param text:
+        The SSML text to compact.
+    :param sentence_break:
+        See :meth:`typecaster.utils.text_to_speech`.
+    :param strip_tags:
+        Whether to remove non-spoken elements and tags that are not SSML. Tags
+        that SSML shares with HTML, such as <sub> and <mark>, are treated as
+        HTML unless they have the attributes SSML requires. Turn it off for
+        text that is already SSML. Defaults to True.
+    """
+    def decode_entity(match):
+        if match.group(1) in xml_entities:
+            return match.group(0)
+        return unescape(match.group(0))
+
+    # Whether each open element of an ambiguous tag is kept, so that closing
+    # tags follow the decision made for their opening tag.
+    kept_elements = {}
+
+    def strip_tag(match):
+        name = match.group(1).lower()
+        tag = match.group(0)
+        if name in html_tags:
+            open_elements = kept_elements.setdefault(name, [])
+            if tag.startswith('</'):
+                keep = open_elements.pop() if open_elements else False
+            else:
+                attribute = ssml_required_attributes.get(name)
+                keep = attribute is not None and re.search(r'\s' + attribute + r'\s*=', tag) is not None
+                if not tag.endswith('/>'):
+                    open_elements.append(keep)
+            if keep:
+                return tag
+        elif name in ssml_tags:
+            return tag
+
+        if name in inline_tags:
+            return ''
+        return ' '
+
+    ssml_text = comment_pattern.sub('', text)
+    if strip_tags:
+        ssml_text = non_spoken_pattern.sub(' ', ssml_text)
+        ssml_text = tag_pattern.sub(strip_tag, ssml_text)
+    ssml_text = entity_pattern.sub(decode_entity, ssml_text)
+
+    # Removing an empty element can leave its parent empty.
+    previous = None
+    while previous != ssml_text:
+        previous = ssml_text
+        ssml_text = empty_element_pattern.sub('', ssml_text)
+
+    sentences = ssml_text.split(sentence_break) if sentence_break else [ssml_text]
+    sentences = [whitespace_pattern.sub(' ', sentence).strip() for sentence in sentences]
+    ssml_text = sentence_break.join(sentence for sentence in sentences if sentence)
+
+    return ssml_text, len(text) - len(ssml_text)
+
+
+def compact_pieces(pieces, sentence_break='. ', strip_tags=True, callback=None):
+    """
+    Compact SSML text that arrives in pieces, such as from a download, with
+    :meth:`compact_ssml`. Text is compacted up to the last sentence break that
+    is not inside a comment, a non-spoken element or a tag that has not been
+    closed yet. The rest is held back until the next piece arrives.
+
+    :param pieces:
+        An iterable of SSML text pieces.
+    :param sentence_break:
+        See :meth:`typecaster.utils.text_to_speech`.
+    :param strip_tags:
+        See :meth:`compact_ssml`.
+    :param callback:
+        A function that is called with the total number of characters saved
+        once every piece has been compacted. Defaults to None.
+    """
+    pending = ''
+    characters_saved = 0
+    for piece in pieces:
+        pending += piece
+        if not sentence_break:
+            continue
+
+        # Move back to a sentence break that is not inside any markup.
+        end = pending.rfind(sentence_break, 0, open_markup_start(pending, strip_tags))
+        while end >= 0:
+            limit = open_markup_start(pending[:end], strip_tags)
+            if limit == end:
+                break
+            end = pending.rfind(sentence_break, 0, limit)
+        if end < 0:
+            continue
+
+        end += len(sentence_break)
+        ssml_text = compact_ssml(pending[:end], sentence_break, strip_tags)[0]
+        if ssml_text:
+            ssml_text += sentence_break
+            yield ssml_text
+        characters_saved += end - len(ssml_text)
+        pending = pending[end:]
+
+    ssml_text = compact_ssml(pending, sentence_break, strip_tags)[0]
+    if ssml_text:
+        yield ssml_text
+    characters_saved += len(pending) - len(ssml_text)
+
+    if callback is not None:
+        callback(characters_saved)
+
+
+def open_markup_start(text, strip_tags=True):
+    """
+    Get the index of the first comment, non-spoken element or tag in the text
+    that is not closed, or the length of the text if everything is closed.
+
+    :param text:
+        The SSML text to search.
+    :param strip_tags:
+        See :meth:`compact_ssml`.
+    """
+    position = 0
+    while True:
+        start = text.find('<', position)
+        if start < 0:
+            return len(text)
+
+        match = comment_pattern.match(text, start) or (strip_tags and non_spoken_pattern.match(text, start))
+        if match:
+            position = match.end()
+        elif (text.startswith('<!--', start) or (strip_tags and non_spoken_start_pattern.match(text, start)) or
+              text.find('>', start) < 0):
+            return start
+        else:
+            position = start + 1
+
+
 def plain_to_ssml(text):
     """
     Incomplete. Returns inputted text.
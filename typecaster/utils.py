@@ -1,21 +1,32 @@
 #!/usr/bin/env python
 
+import io
 import os
-import requests
-from pydub import AudioSegment
+import re
+import six
+import sys
+import threading
+from six.moves import queue
 import xml.etree.ElementTree as ET
 
+from typecaster.ratelimit import synthesis_scheduler
+
 watson_url = 'https://stream.watsonplatform.net/text-to-speech/api/v1/synthesize'
+fragment_pattern = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+prefetch_done = object()
 
 
-def text_to_speech(text, synthesizer, synth_args, sentence_break):
+def text_to_speech(text, synthesizer, synth_args, sentence_break, fragments=None, priority='interactive'):
     """
     Converts given text to a pydub AudioSegment using a specified speech
     synthesizer. At the moment, IBM Watson's text-to-speech API is the only
     available synthesizer.
 
     :param text:
-        The text that will be synthesized to audio.
+        The text that will be synthesized to audio. Can also be an iterable of
+        text pieces, such as a generator that downloads a long document. Pieces
+        are read in a background thread and each complete sentence is
+        synthesized as soon as it arrives.
     :param synthesizer:
         The text-to-speech synthesizer to use.  At the moment, 'watson' is the
         only available input.
@@ -25,44 +36,189 @@ def text_to_speech(text, synthesizer, synth_args, sentence_break):
     :param sentence_break:
         A string that identifies a sentence break or another logical break in
         the text. Necessary for text longer than 50 words. Defaults to '. '.
+    :param fragments:
+        A dictionary of names mapped to pre-rendered AudioSegments. Placeholders
+        like '{{intro}}' in the text are replaced with the matching fragment
+        without calling the synthesizer. Defaults to None, which leaves
+        placeholders untouched.
+    :param priority:
+        Either 'interactive' or 'batch'. See
+        :meth:`typecaster.ratelimit.SynthesisScheduler.submit`. Defaults to
+        'interactive'.
     """
-    if len(text.split()) < 50:
-        if synthesizer == 'watson':
-            with open('.temp.wav', 'wb') as temp:
-                temp.write(watson_request(text=text, synth_args=synth_args).content)
-            response = AudioSegment.from_wav('.temp.wav')
-            os.remove('.temp.wav')
-            return response
-        else:
-            raise ValueError('"' + synthesizer + '" synthesizer not found.')
+    return join_segments(iter_speech(text, synthesizer, synth_args, sentence_break, fragments, priority))
+
+
+def iter_speech(text, synthesizer, synth_args, sentence_break, fragments=None, priority='interactive'):
+    """
+    Yields pydub AudioSegments for the text in order, each as soon as it has
+    been synthesized. This is the streaming counterpart of
+    :meth:`text_to_speech` and takes the same parameters.
+    """
+    if not isinstance(text, six.string_types):
+        for sentence in iter_sentences(prefetch(text), sentence_break):
+            for segment in iter_speech(sentence, synthesizer, synth_args, sentence_break, fragments, priority):
+                yield segment
+    elif fragments:
+        # re.split with a capturing group alternates text and fragment names.
+        for i, piece in enumerate(fragment_pattern.split(text)):
+            if i % 2 == 1:
+                if piece not in fragments:
+                    raise ValueError('"' + piece + '" fragment not found.')
+                yield fragments[piece]
+            elif piece.strip():
+                for segment in iter_speech(piece, synthesizer, synth_args, sentence_break, priority=priority):
+                    yield segment
+    elif len(text.split()) < 50:
+        yield synthesize(text, synthesizer, synth_args, priority)
     else:
-        segments = []
-        for i, sentence in enumerate(text.split(sentence_break)):
-            if synthesizer == 'watson':
-                with open('.temp' + str(i) + '.wav', 'wb') as temp:
-                    temp.write(watson_request(text=sentence, synth_args=synth_args).content)
-                segments.append(AudioSegment.from_wav('.temp' + str(i) + '.wav'))
-                os.remove('.temp' + str(i) + '.wav')
-            else:
-                raise ValueError('"' + synthesizer + '" synthesizer not found.')
+        for sentence in text.split(sentence_break):
+            if sentence.strip():
+                yield synthesize(sentence, synthesizer, synth_args, priority)
+
+
+def synthesize(text, synthesizer, synth_args, priority='interactive'):
+    """
+    Synthesizes a single piece of text to a pydub AudioSegment with one
+    synthesizer request.
+
+    :param text:
+        See :meth:`text_to_speech`.
+    :param synthesizer:
+        See :meth:`text_to_speech`.
+    :param synth_args:
+        See :meth:`text_to_speech`.
+    :param priority:
+        See :meth:`text_to_speech`.
+    """
+    from pydub import AudioSegment
+
+    if synthesizer == 'watson':
+        response = watson_request(text=text, synth_args=synth_args, priority=priority)
+    else:
+        raise ValueError('"' + synthesizer + '" synthesizer not found.')
+
+    return AudioSegment.from_wav(io.BytesIO(response.content))
+
+
+def join_segments(segments):
+    """
+    Concatenates AudioSegments in order. Returns an empty AudioSegment if there
+    are none.
+
+    :param segments:
+        An iterable of AudioSegments.
+    """
+    from pydub import AudioSegment
 
-        response = segments[0]
-        for segment in segments[1:]:
-            response = response + segment
+    response = AudioSegment.empty()
+    for segment in segments:
+        response = response + segment
 
-        return response
+    return response
 
 
-def watson_request(text, synth_args):
+def encode_mp3(segment):
     """
-    Makes a single request to the IBM Watson text-to-speech API.
+    Encodes an AudioSegment to mp3 bytes without a Xing or ID3 header, so that
+    consecutive encoded segments can be concatenated into one playable stream.
+
+    :param segment:
+        The AudioSegment to encode.
+    """
+    output = io.BytesIO()
+    segment.export(output, format='mp3', parameters=['-write_xing', '0', '-id3v2_version', '0'])
+    return output.getvalue()
+
+
+def iter_sentences(pieces, sentence_break):
+    """
+    Yields complete sentences from text that arrives in pieces, as soon as the
+    sentence break that ends them has arrived. Blank sentences are skipped.
+
+    :param pieces:
+        An iterable of text pieces.
+    :param sentence_break:
+        See :meth:`text_to_speech`.
+    """
+    buffer = ''
+    for piece in pieces:
+        buffer += piece
+        sentences = buffer.split(sentence_break)
+        buffer = sentences.pop()
+        for sentence in sentences:
+            if sentence.strip():
+                yield sentence
+
+    if buffer.strip():
+        yield buffer
+
+
+def prefetch(iterable, size=16):
+    """
+    Iterates over an iterable in a background thread, so that producing the
+    next items overlaps with processing the current one. Exceptions raised by
+    the iterable are raised again by the returned generator.
+
+    :param iterable:
+        The iterable to consume, such as a generator that downloads text.
+    :param size:
+        The number of items to read ahead. Defaults to 16.
+    """
+    items = queue.Queue(size)
+    stopped = threading.Event()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+        except Exception:
+            put((None, sys.exc_info()))
+        else:
+            put((prefetch_done, None))
+
+    thread = threading.Thread(target=produce)
+    thread.daemon = True
+    thread.start()
+
+    try:
+        while True:
+            item, error = items.get()
+            if error is not None:
+                six.reraise(*error)
+            if item is prefetch_done:
+                return
+            yield item
+    finally:
+        stopped.set()
+
+
+def watson_request(text, synth_args, priority='interactive'):
+    """
+    Makes a single request to the IBM Watson text-to-speech API. Requests from
+    every podcast in the process share
+    :data:`typecaster.ratelimit.synthesis_scheduler`.
 
     :param text:
         The text that will be synthesized to audio.
     :param synth_args:
         A dictionary of arguments to add to the request. These should include
         username and password for authentication.
+    :param priority:
+        See :meth:`text_to_speech`.
     """
+    import requests
+
     params = {
         'text': text,
         'accept': 'audio/wav'
@@ -79,7 +235,8 @@ def watson_request(text, synth_args):
     else:
         raise Warning('The IBM Watson API requires credentials that should be passed as "username" and "password" in "synth_args"')
 
-    return requests.get(watson_url, auth=(username, password), params=params)
+    return synthesis_scheduler.submit(lambda: requests.get(watson_url, auth=(username, password), params=params),
+                                      cost=len(text), priority=priority)
 
 
 def build_rss_feed(podcast):
@@ -113,7 +270,8 @@ def build_rss_feed(podcast):
         ET.SubElement(channel, 'itunes:category').text = category
 
     for episode in sorted(podcast.episodes.values(), key=lambda x: x.publish_date):
-        if episode.published is True:
+        # Episodes without rendered audio have no mp3 file to link to yet.
+        if episode.published is True and episode.length:
             item = ET.SubElement(channel, 'item')
             ET.SubElement(item, 'title').text = episode.title
             ET.SubElement(item, 'author').text = episode.author